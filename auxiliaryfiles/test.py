@@ -42,349 +42,1957 @@ class AbstractLondonRailwayMapper(ABC):
         outputList = []
         return outputList
 
+import csv
+import itertools
 import math
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from types import MappingProxyType
+
+EARTH_REDIUS = 6371.004 #km average radius
+
+# great-circle distance in km between two points given in degrees
+def greatCircle(latself, lonself, latstation, lonstation):
+    radLat1 = latself * math.pi / 180.0
+    radLat2 = latstation * math.pi / 180.0
+    a = radLat1 - radLat2
+    b = lonself * math.pi / 180.0 - lonstation * math.pi / 180.0
+    s = 2 * math.asin(math.sqrt(math.pow(math.sin(a/2), 2) + math.cos(radLat1) * math.cos(radLat2) * math.pow(math.sin(b/2), 2)))
+    return s * EARTH_REDIUS
+
+# great-circle distances in km between every pair of points, computed once
+# with the per-point radians and cosines shared across a whole row; returns
+# one array row per point so matrix[a][b] matches greatCircle exactly
+def greatCircleMatrix(latitudes, longitudes):
+    radLats = [latitude * math.pi / 180.0 for latitude in latitudes]
+    radLons = [longitude * math.pi / 180.0 for longitude in longitudes]
+    cosLats = [math.cos(radLat) for radLat in radLats]
+    size = len(radLats)
+    matrix = [array("d", bytes(8*size)) for i in range(size)]
+    for i in range(size):
+        radLat1 = radLats[i]
+        radLon1 = radLons[i]
+        cosLat1 = cosLats[i]
+        row = matrix[i]
+        for j in range(i + 1, size):
+            a = radLat1 - radLats[j]
+            b = radLon1 - radLons[j]
+            s = 2 * math.asin(math.sqrt(math.pow(math.sin(a/2), 2) + cosLat1 * cosLats[j] * math.pow(math.sin(b/2), 2))) * EARTH_REDIUS
+            row[j] = s
+            matrix[j][i] = s
+    return matrix
+
+# positions of the set bits of a non-negative int, lowest first
+def bitIndices(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
 
 class Station:
-    def __init__(self, name, latitude, longitude):
+    # no per-instance __dict__, so a whole network of stations stays small
+    __slots__ = ("name", "latitude", "longitude", "relation", "relationLines", "lineBits", "lineNames")
+    
+    # lineNames is the line table of the Network the station belongs to
+    def __init__(self, name, latitude, longitude, lineNames=None):
         self.name = name
-        self.latitude = latitude
-        self.longitude = longitude
+        # parsed once here rather than on every distance calculation
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
         self.relation = {}
-        self.line = []
+        # bit i of relationLines[name] is set when line lineNames[i] runs
+        # along the track to the neighbouring station name
+        self.relationLines = {}
+        # bit i is set when the station is on line lineNames[i]
+        self.lineBits = 0
+        self.lineNames = [] if lineNames is None else lineNames
+
+    # names of the lines serving the station, in the order the network first
+    # saw them
+    @property
+    def line(self):
+        return [self.lineNames[i] for i in bitIndices(self.lineBits)]
 
     def rad(self, d):
         return d * math.pi / 180.0
 
     def getDistance(self, station):
-        EARTH_REDIUS = 6371.004 #km average radius
-        latself = float(self.latitude)
-        latstation = float(station.latitude)
-        lonself = float(self.longitude)
-        lonstation = float(station.longitude)
-        C = math.sin(latstation)*math.sin(latself) + math.cos(latstation)*math.cos(latself)*math.cos(lonstation - lonself)
-        radLat1 = self.rad(latself)
-        radLat2 = self.rad(latstation)
-        a = radLat1 - radLat2
-        b = self.rad(lonself) - self.rad(lonstation)
-        s = 2 * math.asin(math.sqrt(math.pow(math.sin(a/2), 2) + math.cos(radLat1) * math.cos(radLat2) * math.pow(math.sin(b/2), 2)))
-        s = s * EARTH_REDIUS
-        
-        return s
+        return greatCircle(self.latitude, self.longitude, station.latitude, station.longitude)
 
     def addRelation(self, station):
-        if station.name not in self.relation.keys():
+        if station.name not in self.relation:
             distance = self.getDistance(station)
             self.relation[station.name] = distance
             station.relation[self.name] = distance
 
+    # linename is the name of a line serving the station; a line new to the
+    # station's line table is added to it
     def addLineinfo(self, linename):
-        if linename not in self.line:
-            self.line.append(linename)
+        if linename in self.lineNames:
+            self.addLineId(self.lineNames.index(linename))
+        else:
+            self.addLineId(len(self.lineNames))
+            self.lineNames.append(sys.intern(linename))
+
+    # as addLineinfo, for a line already in the table, by its id
+    def addLineId(self, lineId):
+        if isinstance(self.relation, MappingProxyType):
+            raise TypeError("station " + self.name + " belongs to a frozen network")
+        self.lineBits |= 1 << lineId
+
+    def addTrackLine(self, station, lineId):
+        bit = 1 << lineId
+        self.relationLines[station.name] = self.relationLines.get(station.name, 0) | bit
+        station.relationLines[self.name] = station.relationLines.get(self.name, 0) | bit
+    
+    # makes the station read-only, see Network.freeze
+    def freeze(self, lineNames):
+        self.relation = MappingProxyType(self.relation)
+        self.relationLines = MappingProxyType(self.relationLines)
+        self.lineNames = lineNames
     
 class Network:
     def __init__(self):
         self.stations = {}
+        # dense integer id of every station, in the order they were added
+        self.stationIds = {}
+        self.stationNames = []
+        # every line name once, shared by all the stations, with its id
+        self.lineNames = []
+        self.lineIds = {}
+        self.frozen = False
+    
+    # makes the network and its stations read-only so it can be shared: the
+    # tables become mappings and tuples that cannot be changed, and adding
+    # stations or lines raises a TypeError; returns the network
+    def freeze(self):
+        if not self.frozen:
+            self.frozen = True
+            self.lineNames = tuple(self.lineNames)
+            self.stationNames = tuple(self.stationNames)
+            self.lineIds = MappingProxyType(self.lineIds)
+            self.stationIds = MappingProxyType(self.stationIds)
+            self.stations = MappingProxyType(self.stations)
+            for station in self.stations.values():
+                station.freeze(self.lineNames)
+        return self
     
     def addStation(self, name, latitude, longitude):
-        if name not in self.stations.keys():
-            station = Station(name, latitude, longitude)
+        if self.frozen:
+            raise TypeError("cannot add a station to a frozen network")
+        if name not in self.stations:
+            name = sys.intern(name)
+            station = Station(name, latitude, longitude, self.lineNames)
             self.stations[name] = station
+            self.stationIds[name] = len(self.stationNames)
+            self.stationNames.append(name)
     
     def addLine(self, stationA, stationB, linename):
+        if self.frozen:
+            raise TypeError("cannot add a line to a frozen network")
+        lineId = self.lineIds.get(linename)
+        if lineId is None:
+            # stations may have added lines to the shared table themselves
+            for i in range(len(self.lineIds), len(self.lineNames)):
+                self.lineIds[self.lineNames[i]] = i
+            lineId = self.lineIds.get(linename)
+        if lineId is None:
+            lineId = self.lineIds[linename] = len(self.lineNames)
+            self.lineNames.append(sys.intern(linename))
         stationA.addRelation(stationB)
-        stationA.addLineinfo(linename)
-        stationB.addLineinfo(linename)
+        stationA.addTrackLine(stationB, lineId)
+        stationA.addLineId(lineId)
+        stationB.addLineId(lineId)
 
     def getStation(self, name):
         return self.stations.get(name)
 
-import csv
-import random
-import math
+# read-only form of the network for the search code: stations are dense ids,
+# coordinates are floats and the adjacency is in compressed sparse row form,
+# the neighbours of station v are neighbours[offsets[v]:offsets[v+1]] and the
+# matching edge lengths in km are weights[offsets[v]:offsets[v+1]]
+class CompiledNetwork:
+    # an empty graph, filled in by loadCompiledNetwork or loadSnapshot
+    def __init__(self):
+        self.stationIds = {}
+        self.stationNames = []
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.offsets = array("l", [0])
+        self.neighbours = array("l")
+        self.weights = array("d")
+        # the lines serving station v are lineNames[i] for the i in
+        # stationLines[lineOffsets[v]:lineOffsets[v+1]]
+        self.lineNames = []
+        self.lineOffsets = array("l", [0])
+        self.stationLines = array("l")
+        # the lines running along edge e are lineNames[i] for the i in
+        # edgeLines[edgeLineOffsets[e]:edgeLineOffsets[e+1]]
+        self.edgeLineOffsets = array("l", [0])
+        self.edgeLines = array("l")
+        self.straightLines = None
+        self.lineStateTables = None
+    
+    def size(self):
+        return len(self.stationNames)
+    
+    # all-pairs straight line distances in km, built on first use
+    def straightLineMatrix(self):
+        if self.straightLines is None:
+            self.straightLines = greatCircleMatrix(self.latitudes, self.longitudes)
+        return self.straightLines
+    
+    # tables for searching over (station, line) states, built on first use:
+    # state i is station stateStations[i] riding line stationLines[i], and
+    # following edgeLines[m] leads to state edgeLineStates[m]
+    def lineStates(self):
+        if self.lineStateTables is None:
+            size = self.size()
+            stateStations = array("l", [0])*len(self.stationLines)
+            stateIds = {}
+            for v in range(size):
+                for state in range(self.lineOffsets[v], self.lineOffsets[v + 1]):
+                    stateStations[state] = v
+                    stateIds[v, self.stationLines[state]] = state
+            edgeLineStates = array("l", [0])*len(self.edgeLines)
+            for v in range(size):
+                for edge in range(self.offsets[v], self.offsets[v + 1]):
+                    u = self.neighbours[edge]
+                    for m in range(self.edgeLineOffsets[edge], self.edgeLineOffsets[edge + 1]):
+                        edgeLineStates[m] = stateIds[u, self.edgeLines[m]]
+            self.lineStateTables = (stateStations, edgeLineStates)
+        return self.lineStateTables
+
+# binary snapshot of a CompiledNetwork: a header giving the section sizes,
+# then the station and line name tables (utf-8, NUL separated) and the
+# coordinate, CSR, station line and edge line arrays, each padded to 8 bytes
+SNAPSHOT_MAGIC = b"LRMSNAP2"
+SNAPSHOT_HEADER = struct.Struct("<8sqqqqqq")
+
+def snapshotSection(data):
+    return data + bytes(-len(data) % 8)
+
+def saveSnapshot(graph, path):
+    names = "\0".join(graph.stationNames).encode("utf-8")
+    lineNames = "\0".join(graph.lineNames).encode("utf-8")
+    with open(path, "wb") as snapshotFile:
+        snapshotFile.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, graph.size(), len(graph.neighbours), len(graph.stationLines), len(graph.edgeLines), len(names), len(lineNames)))
+        snapshotFile.write(snapshotSection(names))
+        snapshotFile.write(snapshotSection(lineNames))
+        snapshotFile.write(array("d", graph.latitudes).tobytes())
+        snapshotFile.write(array("d", graph.longitudes).tobytes())
+        snapshotFile.write(array("q", graph.offsets).tobytes())
+        snapshotFile.write(array("q", graph.neighbours).tobytes())
+        snapshotFile.write(array("d", graph.weights).tobytes())
+        snapshotFile.write(array("q", graph.lineOffsets).tobytes())
+        snapshotFile.write(array("q", graph.stationLines).tobytes())
+        snapshotFile.write(array("q", graph.edgeLineOffsets).tobytes())
+        snapshotFile.write(array("q", graph.edgeLines).tobytes())
+
+# loads a snapshot written by saveSnapshot; the numeric arrays are read-only
+# views straight onto the memory mapped file, so processes loading the same
+# snapshot share its pages
+def loadSnapshot(path):
+    with open(path, "rb") as snapshotFile:
+        data = mmap.mmap(snapshotFile.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, size, edges, memberships, edgeMemberships, namesLength, lineNamesLength = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("not a railway network snapshot: " + str(path))
+    graph = CompiledNetwork()
+    view = memoryview(data)
+    position = SNAPSHOT_HEADER.size
+    
+    def section(length, typecode=None):
+        nonlocal position
+        part = view[position:position + length]
+        position += length + (-length % 8)
+        return part if typecode is None else part.cast(typecode)
+    
+    names = bytes(section(namesLength)).decode("utf-8")
+    lineNames = bytes(section(lineNamesLength)).decode("utf-8")
+    graph.stationNames = names.split("\0") if size else []
+    graph.stationIds = {name: i for i, name in enumerate(graph.stationNames)}
+    graph.lineNames = lineNames.split("\0") if lineNames else []
+    graph.latitudes = section(8*size, "d")
+    graph.longitudes = section(8*size, "d")
+    graph.offsets = section(8*(size + 1), "q")
+    graph.neighbours = section(8*edges, "q")
+    graph.weights = section(8*edges, "d")
+    graph.lineOffsets = section(8*(size + 1), "q")
+    graph.stationLines = section(8*memberships, "q")
+    graph.edgeLineOffsets = section(8*(edges + 1), "q")
+    graph.edgeLines = section(8*edgeMemberships, "q")
+    graph.snapshot = data
+    return graph
+
+# yields (row number, row) for the data rows of a csv file, reading chunkSize
+# rows at a time so only one chunk is held in memory
+def csvRows(path, chunkSize):
+    with open(path, "r", newline="") as csvFile:
+        reader = csv.reader(csvFile)
+        next(reader, None)
+        rowNumber = 1
+        while True:
+            chunk = list(itertools.islice(reader, chunkSize))
+            if not chunk:
+                return
+            for row in chunk:
+                rowNumber += 1
+                yield rowNumber, row
+
+# collects the bad rows found while loading and raises them all together
+class LoadErrors:
+    def __init__(self, limit=50):
+        self.limit = limit
+        self.count = 0
+        self.messages = []
+    
+    def add(self, path, rowNumber, message):
+        self.count += 1
+        if len(self.messages) < self.limit:
+            self.messages.append(path + " row " + str(rowNumber) + ": " + message)
+    
+    def check(self):
+        if self.count:
+            more = "" if self.count <= self.limit else "\n(" + str(self.count - self.limit) + " more)"
+            raise ValueError(str(self.count) + " bad rows:\n" + "\n".join(self.messages) + more)
+
+# the row of station name and float coordinates, or None after recording why
+# the row is bad
+def parseStationRow(path, rowNumber, row, errors):
+    if len(row) < 3:
+        errors.add(path, rowNumber, "expected name, latitude and longitude")
+        return None
+    try:
+        return row[0], float(row[1]), float(row[2])
+    except ValueError:
+        errors.add(path, rowNumber, "bad coordinates for " + repr(row[0]))
+        return None
+
+# compressed sparse row form of the (source, value) pairs given as two
+# parallel arrays: the values of row v are values[offsets[v]:offsets[v+1]],
+# in the order they were given, with repeats dropped; if labels (a third
+# parallel array of label ids) is given, the labels of every repeat of a
+# pair are merged and returned as a second CSR over the rows' entries,
+# sorted by id, as (offsets, rows, labelOffsets, labelRows)
+def pairsToRows(size, sources, values, labels=None):
+    counts = array("l", [0])*(size + 1)
+    for source in sources:
+        counts[source + 1] += 1
+    for v in range(size):
+        counts[v + 1] += counts[v]
+    position = array("l", counts)
+    ordered = array("l", [0])*len(values)
+    orderedLabels = None if labels is None else array("l", [0])*len(labels)
+    for i, source in enumerate(sources):
+        ordered[position[source]] = values[i]
+        if labels is not None:
+            orderedLabels[position[source]] = labels[i]
+        position[source] += 1
+    offsets = array("l", [0])
+    rows = array("l")
+    labelOffsets = array("l", [0])
+    labelRows = array("l")
+    for v in range(size):
+        # only one row's entries are held at a time
+        seen = {}
+        for i in range(counts[v], counts[v + 1]):
+            value = ordered[i]
+            if value not in seen:
+                seen[value] = 0
+                rows.append(value)
+            if labels is not None:
+                seen[value] |= 1 << orderedLabels[i]
+        offsets.append(len(rows))
+        if labels is not None:
+            for value in rows[offsets[v]:]:
+                labelRows.extend(bitIndices(seen[value]))
+                labelOffsets.append(len(labelRows))
+    if labels is None:
+        return offsets, rows
+    return offsets, rows, labelOffsets, labelRows
+
+# builds a CompiledNetwork straight from the station and line csv files,
+# without Station objects: names are interned to ids as they stream past and
+# everything else goes into arrays; every bad row (short rows, bad
+# coordinates, unknown station names) is reported at once in a ValueError
+def loadCompiledNetwork(stationsPath, linesPath, chunkSize=65536):
+    graph = CompiledNetwork()
+    errors = LoadErrors()
+    for rowNumber, row in csvRows(stationsPath, chunkSize):
+        station = parseStationRow(stationsPath, rowNumber, row, errors)
+        if station is not None and station[0] not in graph.stationIds:
+            name = sys.intern(station[0])
+            graph.stationIds[name] = len(graph.stationNames)
+            graph.stationNames.append(name)
+            graph.latitudes.append(station[1])
+            graph.longitudes.append(station[2])
+    ids = graph.stationIds
+    lineIds = {}
+    # both directions of every track, interleaved in file order as
+    # Network.addLine would see them
+    edgeFrom = array("l")
+    edgeTo = array("l")
+    edgeLine = array("l")
+    for rowNumber, row in csvRows(linesPath, chunkSize):
+        if len(row) < 3:
+            errors.add(linesPath, rowNumber, "expected line, from station and to station")
+            continue
+        unknown = [name for name in row[1:3] if name not in ids]
+        if unknown:
+            errors.add(linesPath, rowNumber, "unknown station " + " and ".join(repr(name) for name in unknown))
+            continue
+        if row[0] not in lineIds:
+            lineIds[row[0]] = len(graph.lineNames)
+            graph.lineNames.append(sys.intern(row[0]))
+        a = ids[row[1]]
+        b = ids[row[2]]
+        edgeFrom.extend((a, b))
+        edgeTo.extend((b, a))
+        edgeLine.extend((lineIds[row[0]], lineIds[row[0]]))
+    errors.check()
+    size = graph.size()
+    # the lines of each edge are merged while its repeats are dropped
+    graph.offsets, graph.neighbours, graph.edgeLineOffsets, graph.edgeLines = pairsToRows(size, edgeFrom, edgeTo, edgeLine)
+    # line ids are in order of first appearance, as in Network, and each
+    # station lists its lines by id like the bits of Station.lineBits
+    graph.lineOffsets, graph.stationLines = pairsToRows(size, edgeFrom, edgeLine)
+    for v in range(size):
+        start, end = graph.lineOffsets[v], graph.lineOffsets[v + 1]
+        graph.stationLines[start:end] = array("l", sorted(graph.stationLines[start:end]))
+    latitudes = graph.latitudes
+    longitudes = graph.longitudes
+    for v in range(size):
+        for edge in range(graph.offsets[v], graph.offsets[v + 1]):
+            u = graph.neighbours[edge]
+            graph.weights.append(greatCircle(latitudes[v], longitudes[v], latitudes[u], longitudes[u]))
+    return graph
+
+# networks shared by every mapper in the process, keyed by kind and the
+# absolute paths of the files they were loaded from, each held with the
+# modification times of those files so a changed file is loaded again and
+# replaces the old entry; the lock makes sure each one is only built once
+sharedNetworks = {}
+sharedNetworksLock = threading.Lock()
+
+# returns the kind of network ("graph" or "network") built from paths,
+# calling build() to make it the first time it is asked for
+def loadShared(kind, paths, build):
+    key = (kind,) + tuple(os.path.abspath(path) for path in paths)
+    mtimes = tuple(os.path.getmtime(path) for path in paths)
+    with sharedNetworksLock:
+        entry = sharedNetworks.get(key)
+        if entry is None or entry[0] != mtimes:
+            entry = sharedNetworks[key] = (mtimes, build())
+        return entry[1]
+
+# bounded cache of query results with least recently used eviction; entries
+# older than ttl seconds (when ttl is set) count as missing, and hits, misses
+# and evictions are counted for stats()
+class QueryCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    # returns the cached value for key, or None
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and self.ttl is not None and timeit.default_timer() - entry[1] > self.ttl:
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    
+    def put(self, key, value):
+        self.entries[key] = (value, timeit.default_timer())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "hitRate": self.hits/lookups if lookups else 0.0}
+
+# QueryCache for shortest path trees, bounded by the bytes held in their
+# arrays rather than by the number of entries
+class TreeCache(QueryCache):
+    def __init__(self, maxBytes):
+        QueryCache.__init__(self)
+        self.maxBytes = maxBytes
+        self.bytes = 0
+    
+    def put(self, key, tree):
+        if key in self.entries:
+            self.bytes -= self.treeBytes(self.entries[key][0])
+        self.entries[key] = (tree, timeit.default_timer())
+        self.entries.move_to_end(key)
+        self.bytes += self.treeBytes(tree)
+        while self.bytes > self.maxBytes and len(self.entries) > 1:
+            evicted = self.entries.popitem(last=False)[1][0]
+            self.bytes -= self.treeBytes(evicted)
+            self.evictions += 1
+    
+    def clear(self):
+        QueryCache.clear(self)
+        self.bytes = 0
+    
+    def treeBytes(self, tree):
+        return sum(len(part)*part.itemsize for part in tree)
+    
+    def stats(self):
+        stats = QueryCache.stats(self)
+        stats["bytes"] = self.bytes
+        return stats
+
+# optimiser for an open railway line through a fixed set of stations; the
+# stations are numbered 0..size-1 and distances[a][b] is the cost of joining
+# a and b, a line is a list holding every station number once
+class LineOptimiser:
+    def __init__(self, distances):
+        self.distances = distances
+        self.size = len(distances)
+    
+    def pathLength(self, path):
+        distances = self.distances
+        return sum(distances[path[i]][path[i+1]] for i in range(len(path) - 1))
+    
+    # constructive starting lines, every one returns (path, length)
+    
+    # nearest neighbour line from every possible first station, keeping the
+    # shortest one
+    def nearestNeighbour(self):
+        distances = self.distances
+        best = None
+        bestLength = math.inf
+        for first in range(self.size):
+            path = [first]
+            unvisited = set(range(self.size))
+            unvisited.discard(first)
+            while unvisited:
+                row = distances[path[-1]]
+                station = min(unvisited, key=row.__getitem__)
+                unvisited.discard(station)
+                path.append(station)
+            length = self.pathLength(path)
+            if length < bestLength:
+                best = path
+                bestLength = length
+        return best, bestLength
+    
+    # greedy edge matching: takes the shortest remaining edges as long as no
+    # station gets more than two of them and no cycle is closed, which leaves
+    # a single line once size-1 edges are chosen
+    def greedyEdge(self):
+        distances = self.distances
+        size = self.size
+        if size < 2:
+            return list(range(size)), 0
+        edges = sorted((distances[a][b], a, b) for a in range(size) for b in range(a + 1, size))
+        degree = [0]*size
+        group = list(range(size))
+        linked = [[] for i in range(size)]
+        
+        def root(a):
+            while group[a] != a:
+                group[a] = group[group[a]]
+                a = group[a]
+            return a
+        
+        chosen = 0
+        for distance, a, b in edges:
+            if degree[a] < 2 and degree[b] < 2 and root(a) != root(b):
+                group[root(a)] = root(b)
+                degree[a] += 1
+                degree[b] += 1
+                linked[a].append(b)
+                linked[b].append(a)
+                chosen += 1
+                if chosen == size - 1:
+                    break
+        # walk the line from one of its two ends
+        previous = -1
+        station = degree.index(1)
+        path = [station]
+        while len(path) < size:
+            station, previous = [other for other in linked[station] if other != previous][0], station
+            path.append(station)
+        return path, self.pathLength(path)
+    
+    # minimum spanning tree line: builds the tree with prim's algorithm and
+    # visits it depth first from each leaf, so each line is at most twice the
+    # tree length; keeps the shortest
+    def mstLine(self):
+        distances = self.distances
+        size = self.size
+        if size < 2:
+            return list(range(size)), 0
+        children = [[] for i in range(size)]
+        parent = [0]*size
+        cost = list(distances[0])
+        inTree = [False]*size
+        inTree[0] = True
+        for i in range(size - 1):
+            station = min((b for b in range(size) if not inTree[b]), key=cost.__getitem__)
+            inTree[station] = True
+            children[parent[station]].append(station)
+            children[station].append(parent[station])
+            row = distances[station]
+            for b in range(size):
+                if not inTree[b] and row[b] < cost[b]:
+                    cost[b] = row[b]
+                    parent[b] = station
+        best = None
+        bestLength = math.inf
+        for leaf in range(size):
+            if len(children[leaf]) != 1:
+                continue
+            path = []
+            seen = [False]*size
+            stack = [leaf]
+            while stack:
+                station = stack.pop()
+                if seen[station]:
+                    continue
+                seen[station] = True
+                path.append(station)
+                # visit nearer branches first
+                stack.extend(sorted((b for b in children[station] if not seen[b]), key=distances[station].__getitem__, reverse=True))
+            length = self.pathLength(path)
+            if length < bestLength:
+                best = path
+                bestLength = length
+        return best, bestLength
+    
+    # change in length from swapping the stations at positions i < j, only the
+    # (at most four) edges touching those positions are looked at
+    def swapDelta(self, path, i, j):
+        distances = self.distances
+        a = path[i]
+        b = path[j]
+        delta = 0
+        if i > 0:
+            before = distances[path[i-1]]
+            delta += before[b] - before[a]
+        if j < len(path) - 1:
+            after = path[j+1]
+            delta += distances[a][after] - distances[b][after]
+        if j == i + 1:
+            return delta
+        inner = path[i+1]
+        delta += distances[b][inner] - distances[a][inner]
+        inner = path[j-1]
+        delta += distances[inner][a] - distances[inner][b]
+        return delta
+    
+    # change in length from reversing the segment path[i..j], i < j; the edges
+    # inside the segment keep their lengths so only its two ends matter
+    def twoOptDelta(self, path, i, j):
+        distances = self.distances
+        delta = 0
+        if i > 0:
+            before = distances[path[i-1]]
+            delta += before[path[j]] - before[path[i]]
+        if j < len(path) - 1:
+            after = path[j+1]
+            delta += distances[path[i]][after] - distances[path[j]][after]
+        return delta
+    
+    def applyTwoOpt(self, path, i, j):
+        path[i:j+1] = path[i:j+1][::-1]
+    
+    # change in length from moving the segment path[i:i+length] between
+    # path[k] and path[k+1] (k = -1 is the front, k = len(path)-1 the end),
+    # reversed if reverse is set; k must not be in [i-1, i+length-1]
+    def orOptDelta(self, path, i, length, k, reverse):
+        distances = self.distances
+        last = len(path) - 1
+        first = path[i]
+        end = path[i+length-1]
+        if reverse:
+            first, end = end, first
+        delta = 0
+        # close the gap the segment leaves behind
+        if i > 0:
+            delta -= distances[path[i-1]][path[i]]
+        if i + length <= last:
+            delta -= distances[path[i+length-1]][path[i+length]]
+        if i > 0 and i + length <= last:
+            delta += distances[path[i-1]][path[i+length]]
+        # open the gap it is moved into
+        if k >= 0 and k < last:
+            delta -= distances[path[k]][path[k+1]]
+        if k >= 0:
+            delta += distances[path[k]][first]
+        if k < last:
+            delta += distances[end][path[k+1]]
+        return delta
+    
+    def applyOrOpt(self, path, i, length, k, reverse):
+        segment = path[i:i+length]
+        if reverse:
+            segment.reverse()
+        del path[i:i+length]
+        if k >= i:
+            k -= length
+        path[k+1:k+1] = segment
+    
+    # picks a random move of the given type, returns (delta, move) where move
+    # is passed back to applyMove if it is accepted
+    def randomMove(self, path, moveType, rng):
+        size = len(path)
+        if moveType == "oropt":
+            length = rng.randint(1, min(3, size - 1))
+            i = rng.randrange(size - length + 1)
+            # every gap except the two either side of the segment
+            k = rng.randrange(size - length) - 1
+            if k >= i - 1:
+                k += length + 1
+            reverse = length > 1 and rng.random() < 0.5
+            return self.orOptDelta(path, i, length, k, reverse), (moveType, i, length, k, reverse)
+        i = rng.randrange(size)
+        j = rng.randrange(size - 1)
+        if j >= i:
+            j += 1
+        else:
+            i, j = j, i
+        if moveType == "2opt":
+            return self.twoOptDelta(path, i, j), (moveType, i, j)
+        if moveType == "swap":
+            return self.swapDelta(path, i, j), (moveType, i, j)
+        raise ValueError("unknown move type: " + str(moveType))
+    
+    def applyMove(self, path, move):
+        if move[0] == "swap":
+            path[move[1]], path[move[2]] = path[move[2]], path[move[1]]
+        elif move[0] == "2opt":
+            self.applyTwoOpt(path, move[1], move[2])
+        else:
+            self.applyOrOpt(path, move[1], move[2], move[3], move[4])
+    
+    # simulated annealing, each iteration proposes a random move of one of
+    # moveTypes ("swap", "2opt", "oropt"); a move is scored from its delta and
+    # only written into path when it is accepted, so nothing is copied per
+    # iteration; stops after stallLimit rejections in a row or numrange
+    # iterations and returns (path, length, iterations)
+    def anneal(self, path, temperature=10000, decreaseFactor=0.9999, numrange=500000, stallLimit=10000, moveTypes=("swap",), rng=random):
+        path = list(path)
+        size = len(path)
+        if size < 3:
+            return path, self.pathLength(path), 0
+        samecounter = 0
+        num = 0
+        for num in range(numrange):
+            delta, move = self.randomMove(path, rng.choice(moveTypes), rng)
+            # moves that leave the length unchanged (such as reversing the
+            # whole line) count as rejections so the stall cutoff still works
+            if delta < 0 or (delta > 0 and math.exp(-delta/temperature) > rng.random()):
+                self.applyMove(path, move)
+                samecounter = 0
+            else:
+                samecounter += 1
+                if samecounter >= stallLimit:
+                    break
+            temperature = temperature*decreaseFactor
+        return path, self.pathLength(path), num + 1
+    
+    # simulated annealing with a schedule taken from the problem itself: the
+    # starting temperature accepts initialAcceptance of the uphill moves in a
+    # random sample on average, after every epoch the temperature is cooled slowly
+    # while the acceptance rate is in the useful middle range and quickly
+    # otherwise, and the search stops once the best line has not improved for
+    # patience epochs with almost every move rejected; returns the best line
+    # seen as (path, length, iterations)
+    def adaptiveAnneal(self, path, moveTypes=("swap",), initialAcceptance=0.8, patience=5, maxIterations=500000, rng=random):
+        path = list(path)
+        size = len(path)
+        if size < 3:
+            return path, self.pathLength(path), 0
+        # the size of the sampled moves sets the temperature scale; a bad
+        # start may offer no uphill move at all, so downhill moves count by
+        # their size too, and the mean track length stands in if every
+        # sampled move was neutral
+        uphill = []
+        for i in range(100):
+            delta, move = self.randomMove(path, rng.choice(moveTypes), rng)
+            if delta != 0:
+                uphill.append(abs(delta))
+        if not uphill:
+            uphill.append(self.pathLength(path)/(size - 1))
+            if uphill[0] == 0:
+                return path, 0, 0
+        # bisect for the temperature at which moves of the sampled sizes are
+        # accepted initialAcceptance of the time on average
+        low = min(uphill)*1e-3
+        high = max(uphill)*1e3
+        for i in range(60):
+            temperature = math.sqrt(low*high)
+            if sum(math.exp(-delta/temperature) for delta in uphill) < initialAcceptance*len(uphill):
+                low = temperature
+            else:
+                high = temperature
+        epochLength = 20*size
+        length = self.pathLength(path)
+        bestPath = list(path)
+        bestLength = length
+        stale = 0
+        num = 0
+        while num < maxIterations:
+            accepted = 0
+            improved = False
+            for i in range(epochLength):
+                delta, move = self.randomMove(path, rng.choice(moveTypes), rng)
+                if delta < 0 or (delta > 0 and math.exp(-delta/temperature) > rng.random()):
+                    self.applyMove(path, move)
+                    length += delta
+                    accepted += 1
+                    if length < bestLength - 1e-9:
+                        bestLength = length
+                        bestPath = list(path)
+                        improved = True
+            num += epochLength
+            acceptance = accepted/epochLength
+            stale = 0 if improved else stale + 1
+            if stale >= patience and acceptance < 0.02:
+                break
+            if acceptance > 0.5:
+                temperature *= 0.8
+            elif acceptance > 0.05:
+                temperature *= 0.97
+            else:
+                temperature *= 0.9
+        return bestPath, self.pathLength(bestPath), num
+    
+    # deterministic 2-opt local search, applies the best improving segment
+    # reversal until there is none left; returns (path, length, passes)
+    def twoOpt(self, path):
+        path = list(path)
+        size = len(path)
+        passes = 0
+        while True:
+            passes += 1
+            bestDelta = -1e-12
+            bestMove = None
+            for i in range(size - 1):
+                for j in range(i + 1, size):
+                    delta = self.twoOptDelta(path, i, j)
+                    if delta < bestDelta:
+                        bestDelta = delta
+                        bestMove = (i, j)
+            if bestMove is None:
+                return path, self.pathLength(path), passes
+            self.applyTwoOpt(path, bestMove[0], bestMove[1])
+
+    # exact shortest line by held-karp dynamic programming over subsets:
+    # cost[mask*size + j] is the shortest line through the stations in mask
+    # that ends at j; O(2^size * size^2) time so only for small inputs;
+    # returns (path, length, subsets)
+    def heldKarp(self):
+        distances = self.distances
+        size = self.size
+        if size < 2:
+            return list(range(size)), 0, 0
+        full = 1 << size
+        cost = array("d", [math.inf])*(full*size)
+        previous = array("b", [-1])*(full*size)
+        for j in range(size):
+            cost[(1 << j)*size + j] = 0
+        for mask in range(1, full):
+            base = mask*size
+            inside = [j for j in range(size) if mask >> j & 1]
+            outside = [k for k in range(size) if not mask >> k & 1]
+            for j in inside:
+                current = cost[base + j]
+                row = distances[j]
+                for k in outside:
+                    index = (mask | 1 << k)*size + k
+                    newCost = current + row[k]
+                    if newCost < cost[index]:
+                        cost[index] = newCost
+                        previous[index] = j
+        # walk back from the cheapest full line
+        mask = full - 1
+        base = mask*size
+        j = min(range(size), key=lambda end: cost[base + end])
+        path = []
+        while j != -1:
+            path.append(j)
+            index = mask*size + j
+            mask ^= 1 << j
+            j = previous[index]
+        path.reverse()
+        return path, self.pathLength(path), full
+
+# move types used whenever newRailwayLine anneals
+LINE_MOVES = ("swap", "2opt", "oropt")
+
+# constructive starting lines for newRailwayLine, by LineOptimiser method
+LINE_STARTS = {"nn": "nearestNeighbour", "greedy": "greedyEdge", "mst": "mstLine"}
+
+# distance submatrix of the line being optimised, handed to every pool worker
+# once by initAnnealWorker instead of being pickled with each chain
+annealDistances = None
+
+def initAnnealWorker(distances):
+    global annealDistances
+    annealDistances = distances
+
+# one independent annealing chain from a random line, seeded so chains differ
+# and can be reproduced
+def annealChain(seed):
+    rng = random.Random(seed)
+    optimiser = LineOptimiser(annealDistances)
+    path = list(range(optimiser.size))
+    rng.shuffle(path)
+    starttime = timeit.default_timer()
+    path, length, iterations = optimiser.anneal(path, moveTypes=LINE_MOVES, rng=rng)
+    endtime = timeit.default_timer()
+    return {"seed": seed, "path": path, "length": length, "iterations": iterations, "seconds": endtime - starttime}
+
+import heapq
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+KM_TO_MILES = 0.62137
 
 class LondonRailwayMapper(AbstractLondonRailwayMapper):
 
-    def __init__(self):
+    # snapshot is the path of a file written by saveSnapshot() to load the
+    # compiled network from instead of the csv files, in which case there is
+    # no railwayNetwork of Station objects; nothing is loaded until the first
+    # query, and mappers over the same files share one network
+    def __init__(self, snapshot=None, stationsFile="londonstations.csv", linesFile="londonrailwaylines.csv"):
         # ADD YOUR CODE HERE
-        self.railwayNetwork = self.loadStationsAndLines()
+        self.snapshot = snapshot
+        self.stationsFile = stationsFile
+        self.linesFile = linesFile
+        self.sharedGraph = None
+        self.sharedRailwayNetwork = None
+        self.lastExpanded = 0
+        # all-pairs tables filled in by precompute(), rows and columns are
+        # station ids; None until then
+        self.stopsMatrix = None
+        self.distanceMatrix = None
+        # newRailwayLine solves inputs of up to exactLimit stations exactly
+        self.exactLimit = 15
+        self.lastLineInfo = None
+        # result cache in front of minStops, minDistance and newRailwayLine,
+        # off until enableCache() is called
+        self.queryCache = None
+        # cache of whole shortest path trees by source, off until
+        # enableTreeCache() is called
+        self.treeCache = None
             
      
 
+    # the CompiledNetwork every query runs on, streamed straight from the csv
+    # files (or the snapshot) on first use and shared with other mappers
+    @property
+    def graph(self):
+        if self.sharedGraph is None:
+            if self.snapshot is None:
+                self.sharedGraph = loadShared("graph", [self.stationsFile, self.linesFile], lambda: loadCompiledNetwork(self.stationsFile, self.linesFile))
+            else:
+                self.sharedGraph = loadShared("graph", [self.snapshot], lambda: loadSnapshot(self.snapshot))
+        return self.sharedGraph
+    
+    # the Network of Station objects, built on first use and None when loaded
+    # from a snapshot; it is shared with other mappers, so it is frozen
+    @property
+    def railwayNetwork(self):
+        if self.snapshot is not None:
+            return None
+        if self.sharedRailwayNetwork is None:
+            self.sharedRailwayNetwork = loadShared("network", [self.stationsFile, self.linesFile], lambda: self.loadStationsAndLines().freeze())
+        return self.sharedRailwayNetwork
+    
+    # raises a ValueError listing every bad row if the files do not make a
+    # valid network
     def loadStationsAndLines(self):
         # ADD YOUR CODE HERE
         railwayNetwork = Network()
-        csvFilestations = open("londonstations.csv", "r")
-        csvFilerailwaylines = open("londonrailwaylines.csv", "r")
-        reader0 = csv.reader(csvFilestations)
-        reader1 = csv.reader(csvFilerailwaylines)
-        csvFilestations.readline()
-        csvFilerailwaylines.readline()
-        for row in reader0:
-            railwayNetwork.addStation(row[0], row[1], row[2])
-        csvFilestations.close()
-
-        for row in reader1:
-            stationA = railwayNetwork.getStation(row[1])
-            stationB = railwayNetwork.getStation(row[2])
-            railwayNetwork.addLine(stationA, stationB, row[0])
+        errors = LoadErrors()
+        with open(self.stationsFile, "r", newline="") as csvFilestations:
+            reader0 = csv.reader(csvFilestations)
+            csvFilestations.readline()
+            for row in reader0:
+                station = parseStationRow(self.stationsFile, reader0.line_num + 1, row, errors)
+                if station is not None:
+                    railwayNetwork.addStation(station[0], station[1], station[2])
+
+        with open(self.linesFile, "r", newline="") as csvFilerailwaylines:
+            reader1 = csv.reader(csvFilerailwaylines)
+            csvFilerailwaylines.readline()
+            for row in reader1:
+                if len(row) < 3:
+                    errors.add(self.linesFile, reader1.line_num + 1, "expected line, from station and to station")
+                    continue
+                stationA = railwayNetwork.getStation(row[1])
+                stationB = railwayNetwork.getStation(row[2])
+                if stationA is None or stationB is None:
+                    unknown = [name for name in row[1:3] if railwayNetwork.getStation(name) is None]
+                    errors.add(self.linesFile, reader1.line_num + 1, "unknown station " + " and ".join(repr(name) for name in unknown))
+                    continue
+                railwayNetwork.addLine(stationA, stationB, row[0])
+        errors.check()
         
         return railwayNetwork
         
         
     
 
-    def minStops(self, fromS, toS):     
+    # writes the compiled network to path for LondonRailwayMapper(snapshot=path)
+    def saveSnapshot(self, path):
+        saveSnapshot(self.graph, path)
+    
+    # puts a QueryCache holding up to maxsize results, each kept for at most
+    # ttl seconds if ttl is given, in front of the queries; its counters are
+    # available from self.queryCache.stats()
+    def enableCache(self, maxsize=1024, ttl=None):
+        self.queryCache = QueryCache(maxsize, ttl)
+    
+    # keeps the complete shortest path tree of every source searched by
+    # minStops and minDistance, evicting the least recently used trees once
+    # they take more than maxBytes, so later queries from (or to) a cached
+    # station are lookups
+    def enableTreeCache(self, maxBytes=8*1024*1024):
+        self.treeCache = TreeCache(maxBytes)
+    
+    # mode "bfs" searches outwards from fromS only, mode "bidirectional"
+    # searches from both ends and stops where the two frontiers meet
+    def minStops(self, fromS, toS, mode="bfs"):     
         numStops = -1
         # ADD YOUR CODE HERE
-        toStation = self.railwayNetwork.getStation(toS)
-        queue = {}
-        queue[fromS] = 0
-        seen = set()
-        seen.add(fromS)
-        parent = {fromS:None}
-        minimum = {}
-        previous = fromS
-        for station in self.railwayNetwork.stations.keys():
-            minimum[station] = 114514
-        minimum[fromS] = 0
-        while len(queue) > 0:
-            queue = dict(sorted(queue.items(), key = lambda kv:(kv[1], kv[0]), reverse=True))
-            vertex = queue.popitem()
-            vertexName = vertex[0]
-            nodes = self.railwayNetwork.getStation(vertexName).relation.keys()
-            if vertexName == toS:
-                return minimum.get(vertexName)
-            if vertexName == fromS:
-                stops = minimum.get(previous)
-            else:
-                stops = minimum.get(parent.get(vertexName)[0]) + 1
-
-            if minimum[vertexName] > stops:
-                minimum[vertexName] = stops
-            if toS in nodes:
-                return minimum.get(vertexName) + 1
-            for station in nodes:
-                if station not in seen:
-                    score = stops #self.railwayNetwork.getStation(station).getDistance(toStation) + stops
-                    queue[station] = score
-                    seen.add(station)
-                    parent[station] = vertex
-                if toS in self.railwayNetwork.getStation(station).relation.keys():
-                    
-                    return minimum.get(parent.get(station)[0]) + 2
-                    
-            previous = vertexName
-        
-
-            
+        ids = self.graph.stationIds
+        if mode not in ("bfs", "bidirectional"):
+            raise ValueError("unknown minStops mode: " + str(mode))
+        self.lastExpanded = 0
+        if fromS not in ids or toS not in ids:
+            return numStops
+        source = ids[fromS]
+        target = ids[toS]
+        if self.queryCache is None:
+            return self.findStops(source, target, mode)
+        # the network is undirected so A to B and B to A share an entry
+        key = ("stops", min(source, target), max(source, target))
+        numStops = self.queryCache.get(key)
+        if numStops is None:
+            numStops = self.findStops(source, target, mode)
+            self.queryCache.put(key, numStops)
+        return numStops
     
-        return numStops    
+    # minStops between two station ids
+    def findStops(self, source, target, mode):
+        if self.stopsMatrix is not None:
+            return self.stopsMatrix[source][target]
+        if self.treeCache is not None:
+            tree, station = self.cachedTree("stops", source, target)
+            if tree is None:
+                tree, station = self.shortestPathTree("stops", source), target
+            return tree[0][station]
+        if source == target:
+            return 0
+        if mode == "bidirectional":
+            return self.bidirectionalStops(source, target)
+        # breadth-first search, every station is queued at most once so the
+        # search is O(V+E) and the first time toS is reached is the minimum
+        offsets = self.graph.offsets
+        neighbours = self.graph.neighbours
+        stops = array("i", [-1])*self.graph.size()
+        stops[source] = 0
+        queue = deque([source])
+        while queue:
+            vertex = queue.popleft()
+            self.lastExpanded += 1
+            nextStops = stops[vertex] + 1
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                station = neighbours[edge]
+                if stops[station] == -1:
+                    if station == target:
+                        return nextStops
+                    stops[station] = nextStops
+                    queue.append(station)
     
+        return -1
     
+    # source and target are station ids, returns -1 if there is no path
+    def bidirectionalStops(self, source, target):
+        offsets = self.graph.offsets
+        neighbours = self.graph.neighbours
+        stops = [{source: 0}, {target: 0}]
+        frontiers = [[source], [target]]
+        while frontiers[0] and frontiers[1]:
+            # always grow the smaller frontier by one whole level, the graph
+            # is symmetric so the backward search uses the same adjacency
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            mine = stops[side]
+            other = stops[1 - side]
+            best = -1
+            nextFrontier = []
+            for vertex in frontiers[side]:
+                self.lastExpanded += 1
+                nextStops = mine[vertex] + 1
+                for edge in range(offsets[vertex], offsets[vertex + 1]):
+                    station = neighbours[edge]
+                    if station in other:
+                        total = nextStops + other[station]
+                        if best == -1 or total < best:
+                            best = total
+                    if station not in mine:
+                        mine[station] = nextStops
+                        nextFrontier.append(station)
+            # once a level touches the other side, the best meeting point
+            # within that level is the minimum
+            if best != -1:
+                return best
+            frontiers[side] = nextFrontier
+        
+        return -1
     
-    def minDistance(self, fromS, toS):
+    
+    
+    # mode "dijkstra" searches outwards evenly, mode "astar" uses the straight
+    # line distance to toS as an admissible heuristic so fewer stations are
+    # expanded, mode "bidirectional" runs dijkstra from both ends at once;
+    # the number expanded by the last call is kept in lastExpanded
+    def minDistance(self, fromS, toS, mode="dijkstra"):
         minDistance = -1.0
         # ADD YOUR CODE HERE
-        toStation = self.railwayNetwork.getStation(toS)
-        queue = {}
-        queue[fromS] = 0
-        seen = set()
-        seen.add(fromS)
-        parent = {fromS:None}
-        minimum = {}
-        previous = fromS
-        for station in self.railwayNetwork.stations.keys():
-            minimum[station] = 1145141919810
-        minimum[fromS] = 0
-        while len(queue) > 0:
-            queue = dict(sorted(queue.items(), key = lambda kv:(kv[1], kv[0]), reverse=True))
-            vertex = queue.popitem()
-            vertexName = vertex[0]
-            nodes = self.railwayNetwork.getStation(vertexName).relation.keys()
-            if vertexName == fromS:
-                stops = minimum.get(previous)
-            else:
-                stops = minimum.get(parent.get(vertexName)[0]) + self.railwayNetwork.getStation(parent.get(vertexName)[0]).getDistance(self.railwayNetwork.getStation(vertexName))
-
-            if minimum[vertexName] == 1145141919810:
-                minimum[vertexName] = stops
-            #if toS in nodes:
-                #return minimum.get(vertexName)*0.62137
-            for station in nodes:
-                if station not in seen:
-                    score = self.railwayNetwork.getStation(station).getDistance(toStation) + stops + self.railwayNetwork.getStation(station).relation.get(vertexName)
-                    queue[station] = score
-                    seen.add(station)
-                    parent[station] = vertex
-                if toS in self.railwayNetwork.getStation(station).relation.keys():
-                    print(len(minimum))
-                    print(len(seen))
-                    return (minimum.get(parent.get(station)[0]) + self.railwayNetwork.getStation(station).relation.get(parent.get(station)[0]) + self.railwayNetwork.getStation(station).relation.get(toS))*0.62137 #convert into miles
-            previous = vertexName
+        ids = self.graph.stationIds
+        if mode not in ("dijkstra", "astar", "bidirectional"):
+            raise ValueError("unknown minDistance mode: " + str(mode))
+        self.lastExpanded = 0
+        if fromS not in ids or toS not in ids:
+            return minDistance
+        source = ids[fromS]
+        target = ids[toS]
+        if self.queryCache is None:
+            distance = self.findDistance(source, target, mode)
+        else:
+            key = ("distance", min(source, target), max(source, target))
+            distance = self.queryCache.get(key)
+            if distance is None:
+                distance = self.findDistance(source, target, mode)
+                self.queryCache.put(key, distance)
+        if distance == math.inf:
+            return minDistance
+        return distance*KM_TO_MILES
+    
+    # minDistance between two station ids in km, inf if there is no path
+    def findDistance(self, source, target, mode):
+        if self.distanceMatrix is not None:
+            return self.distanceMatrix[source][target]
+        if self.treeCache is not None:
+            tree, station = self.cachedTree("distance", source, target)
+            if tree is None:
+                tree, station = self.shortestPathTree("distance", source), target
+            return tree[0][station]
+        if mode == "bidirectional":
+            return self.bidirectionalDistance(source, target)
+        return self.searchDistance(source, target, mode == "astar")
+    
+    # dijkstra, or A* when useHeuristic is set, between two station ids;
+    # returns the distance in km, inf if target cannot be reached; parents is
+    # filled in as for stopsFrom if given
+    def searchDistance(self, source, target, useHeuristic, parents=None):
+        graph = self.graph
+        offsets = graph.offsets
+        neighbours = graph.neighbours
+        weights = graph.weights
+        # binary heap with lazy deletion: entries whose distance is worse than
+        # the best known one are stale and skipped, target is final once popped
+        minimum = array("d", [math.inf])*graph.size()
+        minimum[source] = 0
+        if useHeuristic:
+            toTarget = graph.straightLineMatrix()[target]
+        heap = [(0, 0, source)]
+        while heap:
+            score, distance, vertex = heapq.heappop(heap)
+            if distance > minimum[vertex]:
+                continue
+            if vertex == target:
+                return distance
+            self.lastExpanded += 1
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                station = neighbours[edge]
+                newDistance = distance + weights[edge]
+                if newDistance < minimum[station]:
+                    minimum[station] = newDistance
+                    score = newDistance
+                    if useHeuristic:
+                        score += toTarget[station]
+                    heapq.heappush(heap, (score, newDistance, station))
+                    if parents is not None:
+                        parents[station] = vertex
         
-        return minDistance
+        return math.inf
+    
+    # source and target are station ids, returns the distance in km, inf if
+    # target cannot be reached
+    def bidirectionalDistance(self, source, target):
+        if source == target:
+            return 0
+        offsets = self.graph.offsets
+        neighbours = self.graph.neighbours
+        weights = self.graph.weights
+        minimum = [{source: 0}, {target: 0}]
+        settled = [set(), set()]
+        heaps = [[(0, source)], [(0, target)]]
+        best = math.inf
+        while heaps[0] and heaps[1]:
+            # no path through an unsettled station can beat best once the two
+            # smallest keys together reach it
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            distance, vertex = heapq.heappop(heaps[side])
+            if vertex in settled[side]:
+                continue
+            settled[side].add(vertex)
+            self.lastExpanded += 1
+            mine = minimum[side]
+            other = minimum[1 - side]
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                station = neighbours[edge]
+                newDistance = distance + weights[edge]
+                if newDistance < mine.get(station, math.inf):
+                    mine[station] = newDistance
+                    heapq.heappush(heaps[side], (newDistance, station))
+                if station in other and newDistance + other[station] < best:
+                    best = newDistance + other[station]
+        
+        return best
         
     
     
-    def newRailwayLine(self, inputList):
-        outputList = []
-        # ADD YOUR CODE HERE
-        numberset = []
-        distset = []
-        temperatureset = []
-        #inuse.reverse()
-        temperature = 10000
-        decreaseFactor = 0.9999
-        numrange = 500000
-        mindis = 1145141919810
-        #plt.figure(figsize = (20,20))
-        for j in range(1):
-            inuse = inputList.copy()
-            random.shuffle(inuse)
-            distanceA = 0
-            samecounter = 0
-            for i in range(len(inuse)):
-                if i < len(inuse) - 1:
-                    distanceA += self.railwayNetwork.getStation(inuse[i]).getDistance(self.railwayNetwork.getStation(inuse[i+1]))
-            for num in range(numrange):
-                changelist = inuse.copy()
-                countA = 0
-                countB = 0
-                distanceB = 0
-                while countA == countB:
-                    countA = random.randint(0,len(inuse)-1)
-                    countB = random.randint(0,len(inuse)-1)
-                if countA > countB:
-                    temp = changelist[countB]
-                    changelist[countB] = changelist[countA]
-                    changelist[countA] = temp
-                else:
-                    temp = changelist[countA]
-                    changelist[countA] = changelist[countB]
-                    changelist[countB] = temp
-                for i in range(len(changelist)):
-                    if i < len(changelist) - 1:
-                        distanceB += self.railwayNetwork.getStation(changelist[i]).getDistance(self.railwayNetwork.getStation(changelist[i+1]))
-                if distanceA > distanceB:
-                    inuse = changelist.copy()
-                    distanceA = distanceB
-                    samecounter = 0
-                    
-                else:
-                    p = math.exp((distanceA - distanceB)/temperature)
-                    r = random.random()
-                    if p > r:
-                        inuse = changelist.copy()
-                        distanceA = distanceB
-                        samecounter = 0
-                        
-                        
+    # returns the fewest changes of line needed to get from fromS to toS,
+    # -1 if there is no route; the first line can be chosen freely and
+    # routes with equally few changes are compared on distance
+    def minInterchanges(self, fromS, toS):
+        ids = self.graph.stationIds
+        self.lastExpanded = 0
+        if fromS not in ids or toS not in ids:
+            return -1
+        route = self.cachedLineSearch(ids[fromS], ids[toS], 0, True)
+        if route is None:
+            return -1
+        return route[0]
+    
+    # returns the minimum distance in miles from fromS to toS when every
+    # change of line costs changePenalty miles on top of the track, -1.0 if
+    # there is no route
+    def minLineDistance(self, fromS, toS, changePenalty=1.0):
+        ids = self.graph.stationIds
+        if changePenalty < 0:
+            raise ValueError("changePenalty must not be negative: " + str(changePenalty))
+        self.lastExpanded = 0
+        if fromS not in ids or toS not in ids:
+            return -1.0
+        route = self.cachedLineSearch(ids[fromS], ids[toS], changePenalty/KM_TO_MILES, False)
+        if route is None:
+            return -1.0
+        return (route[1] + route[0]*changePenalty/KM_TO_MILES)*KM_TO_MILES
+    
+    # searchLines through the query cache when it is enabled; routes are the
+    # same in both directions so one entry serves both
+    def cachedLineSearch(self, source, target, changePenalty, fewestChanges):
+        if self.queryCache is None:
+            return self.searchLines(source, target, changePenalty, fewestChanges)
+        key = ("lines", min(source, target), max(source, target), changePenalty, fewestChanges)
+        route = self.queryCache.get(key)
+        if route is None:
+            route = self.searchLines(source, target, changePenalty, fewestChanges)
+            # a missing route is cached as an empty tuple, since None is a miss
+            self.queryCache.put(key, route or ())
+        return route or None
+    
+    # dijkstra over (station, line) states between two station ids: riding
+    # an edge on the current line costs its length, riding it on another
+    # line is a change; with fewestChanges routes are ordered by changes and
+    # then distance, otherwise by distance plus changePenalty km per change;
+    # returns (changes, distance in km) or None if target cannot be reached
+    def searchLines(self, source, target, changePenalty, fewestChanges):
+        graph = self.graph
+        offsets = graph.offsets
+        weights = graph.weights
+        stationLines = graph.stationLines
+        edgeLineOffsets = graph.edgeLineOffsets
+        edgeLines = graph.edgeLines
+        stateStations, edgeLineStates = graph.lineStates()
+        if source == target:
+            return 0, 0.0
+        # best (cost, tie break) of every state, compared as pairs
+        bestCost = array("d", [math.inf])*len(stationLines)
+        bestTie = array("d", [math.inf])*len(stationLines)
+        heap = []
+        for state in range(graph.lineOffsets[source], graph.lineOffsets[source + 1]):
+            bestCost[state] = 0
+            bestTie[state] = 0
+            heap.append((0, 0, 0, 0.0, state))
+        while heap:
+            cost, tie, changes, distance, state = heapq.heappop(heap)
+            if (cost, tie) > (bestCost[state], bestTie[state]):
+                continue
+            vertex = stateStations[state]
+            if vertex == target:
+                return changes, distance
+            self.lastExpanded += 1
+            line = stationLines[state]
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                newDistance = distance + weights[edge]
+                for m in range(edgeLineOffsets[edge], edgeLineOffsets[edge + 1]):
+                    newChanges = changes if edgeLines[m] == line else changes + 1
+                    if fewestChanges:
+                        newCost, newTie = newChanges, newDistance
                     else:
-                        
-                        samecounter += 1
-                        if samecounter >= 10000:
-                            
-                            print(distanceA)
-                            print(num)
-                            #print(temperature)
-                            if mindis > distanceA:
-                                mindis = distanceA
-                                outputList = inuse.copy()
-                                outputList.append(mindis)
-                            break
-                numberset.append(num)
-                distset.append(distanceA)
-                temperatureset.append(temperature)
-                temperature = temperature*decreaseFactor
-            #outputList.append(distanceA)    
-            
-            #outputList = inuse
+                        newCost, newTie = newDistance + newChanges*changePenalty, newChanges
+                    station = edgeLineStates[m]
+                    if (newCost, newTie) < (bestCost[station], bestTie[station]):
+                        bestCost[station] = newCost
+                        bestTie[station] = newTie
+                        heapq.heappush(heap, (newCost, newTie, newChanges, newDistance, station))
         
+        return None
+    
+    # returns up to k loopless routes from fromS to toS, shortest first, as a
+    # list of (stations, miles, stops) where stations lists the station names
+    # along the route; [] if a station is unknown or there is no route
+    def kShortestRoutes(self, fromS, toS, k):
+        ids = self.graph.stationIds
+        if k < 1:
+            raise ValueError("k must be at least 1: " + str(k))
+        self.lastExpanded = 0
+        if fromS not in ids or toS not in ids:
+            return []
+        source = ids[fromS]
+        target = ids[toS]
+        if self.queryCache is None:
+            routes = self.yenRoutes(source, target, k)
+        else:
+            key = ("routes", source, target, k)
+            routes = self.queryCache.get(key)
+            if routes is None:
+                routes = self.yenRoutes(source, target, k)
+                self.queryCache.put(key, routes)
+        names = self.graph.stationNames
+        return [([names[v] for v in path], distance*KM_TO_MILES, len(path) - 1) for distance, path in routes]
+    
+    # yen's k shortest loopless paths between two station ids, as a list of
+    # (distance in km, list of station ids); every route after the first
+    # leaves an earlier one at some spur station and finds the rest of the
+    # way with spurRoute, avoiding the stations before the spur and the
+    # tracks the earlier routes sharing that root took next
+    def yenRoutes(self, source, target, k):
+        # the shortest path tree into target gives the first route, and
+        # since blocking stations and tracks only makes routes longer its
+        # distances are an exact, consistent heuristic for every spur search
+        toTarget, nextHop = self.shortestPathTree("distance", target)
+        if toTarget[source] == math.inf:
+            return []
+        path = [source]
+        while path[-1] != target:
+            path.append(nextHop[path[-1]])
+        routes = [(toTarget[source], path)]
+        candidates = []
+        seen = {tuple(path)}
+        while len(routes) < k:
+            path = routes[-1][1]
+            rootDistance = 0
+            for i in range(len(path) - 1):
+                spur = path[i]
+                root = path[:i + 1]
+                blockedStations = set(root[:-1])
+                blockedEdges = set()
+                for distance, route in routes:
+                    if route[:i + 1] == root and len(route) > i + 1:
+                        blockedEdges.add((spur, route[i + 1]))
+                spurPath = self.spurRoute(spur, target, toTarget, nextHop, blockedStations, blockedEdges)
+                if spurPath is not None:
+                    candidate = root[:-1] + spurPath[1]
+                    if tuple(candidate) not in seen:
+                        seen.add(tuple(candidate))
+                        heapq.heappush(candidates, (rootDistance + spurPath[0], candidate))
+                rootDistance += self.graph.weights[self.edgeBetween(spur, path[i + 1])]
+            if not candidates:
+                break
+            routes.append(heapq.heappop(candidates))
+        return routes
+    
+    # A* from station id spur to target that may not enter blockedStations
+    # or use the (from, to) tracks in blockedEdges, guided by toTarget, the
+    # distances of the tree into target; as soon as a station is taken off
+    # the heap whose tree path nextHop to target is clear of the blocked
+    # stations and tracks, that path finishes the route, since with an exact
+    # heuristic nothing taken off later can be shorter; returns (distance in
+    # km, list of station ids) or None if target cannot be reached
+    def spurRoute(self, spur, target, toTarget, nextHop, blockedStations, blockedEdges):
+        offsets = self.graph.offsets
+        neighbours = self.graph.neighbours
+        weights = self.graph.weights
+        minimum = {spur: 0}
+        parents = {spur: -1}
+        heap = [(toTarget[spur], 0, spur)]
+        while heap:
+            score, distance, vertex = heapq.heappop(heap)
+            if distance > minimum[vertex]:
+                continue
+            self.lastExpanded += 1
+            tail = [vertex]
+            while tail[-1] != target:
+                station = nextHop[tail[-1]]
+                if station == spur or station in blockedStations or (tail[-1], station) in blockedEdges:
+                    break
+                tail.append(station)
+            if tail[-1] == target:
+                path = []
+                while vertex != -1:
+                    path.append(vertex)
+                    vertex = parents[vertex]
+                path.reverse()
+                return score, path + tail[1:]
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                station = neighbours[edge]
+                if station in blockedStations or (vertex, station) in blockedEdges:
+                    continue
+                newDistance = distance + weights[edge]
+                if newDistance < minimum.get(station, math.inf):
+                    minimum[station] = newDistance
+                    parents[station] = vertex
+                    heapq.heappush(heap, (newDistance + toTarget[station], newDistance, station))
         
+        return None
+    
+    # index of the edge from station id a to the adjacent station id b, -1
+    # if they are not adjacent
+    def edgeBetween(self, a, b):
+        graph = self.graph
+        for edge in range(graph.offsets[a], graph.offsets[a + 1]):
+            if graph.neighbours[edge] == b:
+                return edge
+        return -1
+    
+    # the journey with the fewest stops from fromS to toS, found with a single
+    # search, as (stations, miles, stops, lines) where stations lists the
+    # station names along it and lines[i] the names of the lines running
+    # between stations[i] and stations[i+1]; None if a station is unknown or
+    # there is no route
+    def minStopsPath(self, fromS, toS):
+        return self.findJourney(fromS, toS, "stops", False)
+    
+    # the shortest journey in miles from fromS to toS, as for minStopsPath;
+    # mode is "dijkstra" or "astar" as for minDistance
+    def minDistancePath(self, fromS, toS, mode="dijkstra"):
+        if mode not in ("dijkstra", "astar"):
+            raise ValueError("unknown minDistancePath mode: " + str(mode))
+        return self.findJourney(fromS, toS, "distance", mode == "astar")
+    
+    # one search of kind "stops" or "distance" from fromS to toS, keeping the
+    # predecessor of every station reached so the route can be read back
+    def findJourney(self, fromS, toS, kind, useHeuristic):
+        ids = self.graph.stationIds
+        self.lastExpanded = 0
+        if fromS not in ids or toS not in ids:
+            return None
+        source = ids[fromS]
+        target = ids[toS]
+        if self.treeCache is not None:
+            path = self.treePath(kind, source, target)
+        else:
+            parents = array("l", [-1])*self.graph.size()
+            if kind == "stops":
+                reached = self.stopsFrom(source, [target], parents)[target] != -1
+            elif useHeuristic:
+                reached = self.searchDistance(source, target, True, parents) != math.inf
+            else:
+                reached = self.distancesFrom(source, [target], parents)[target] != math.inf
+            path = None
+            if reached:
+                path = [target]
+                while path[-1] != source:
+                    path.append(parents[path[-1]])
+                path.reverse()
+        if path is None:
+            return None
+        return self.describeRoute(path)
+    
+    # route between two station ids read off a shortest path tree of kind,
+    # from the tree cache if either end has one; None if there is no route
+    def treePath(self, kind, source, target):
+        tree, station = self.cachedTree(kind, source, target)
+        if tree is None:
+            tree, station = self.shortestPathTree(kind, source), target
+        row, parents = tree
+        if row[station] == -1 or row[station] == math.inf:
+            return None
+        # walking up the tree goes towards its root, so a tree rooted at
+        # source gives the route backwards
+        path = [station]
+        while parents[path[-1]] != -1:
+            path.append(parents[path[-1]])
+        if station == target:
+            path.reverse()
+        return path
+    
+    # (stations, miles, stops, lines) for a route given as station ids, as
+    # returned by minStopsPath
+    def describeRoute(self, path):
+        graph = self.graph
+        distance = 0
+        lines = []
+        for a, b in zip(path, path[1:]):
+            edge = self.edgeBetween(a, b)
+            distance += graph.weights[edge]
+            lines.append([graph.lineNames[i] for i in graph.edgeLines[graph.edgeLineOffsets[edge]:graph.edgeLineOffsets[edge + 1]]])
+        return [graph.stationNames[v] for v in path], distance*KM_TO_MILES, len(path) - 1, lines
+    
+    # builds the all-pairs stops and distance (km) tables with one full
+    # search from every station, after which minStops and minDistance are
+    # plain table lookups
+    def precompute(self):
+        stationIds = range(self.graph.size())
+        self.stopsMatrix = [self.stopsFrom(source) for source in stationIds]
+        self.distanceMatrix = [self.distancesFrom(source) for source in stationIds]
+    
+    # number of stops from station id source to every station, indexed by
+    # station id, -1 for stations that cannot be reached; if targets (a
+    # collection of station ids) is given the search stops as soon as they
+    # have all been reached and only their entries are complete; if parents
+    # (an array of one entry per station) is given the previous station on
+    # each path is written into it, -1 for source and unreached stations
+    def stopsFrom(self, source, targets=None, parents=None):
+        offsets = self.graph.offsets
+        neighbours = self.graph.neighbours
+        row = array("i", [-1])*self.graph.size()
+        row[source] = 0
+        remaining = None
+        if targets is not None:
+            remaining = set(targets)
+            remaining.discard(source)
+            if not remaining:
+                return row
+        queue = deque([source])
+        while queue:
+            vertex = queue.popleft()
+            nextStops = row[vertex] + 1
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                station = neighbours[edge]
+                if row[station] == -1:
+                    row[station] = nextStops
+                    queue.append(station)
+                    if parents is not None:
+                        parents[station] = vertex
+                    if remaining is not None and station in remaining:
+                        remaining.discard(station)
+                        if not remaining:
+                            return row
+        return row
+    
+    # distance in km from station id source to every station, indexed by
+    # station id, inf for stations that cannot be reached; if targets is
+    # given the search stops once they are all settled and only their
+    # entries are final; parents is filled in as for stopsFrom
+    def distancesFrom(self, source, targets=None, parents=None):
+        offsets = self.graph.offsets
+        neighbours = self.graph.neighbours
+        weights = self.graph.weights
+        row = array("d", [math.inf])*self.graph.size()
+        row[source] = 0
+        remaining = None
+        if targets is not None:
+            remaining = set(targets)
+        heap = [(0, source)]
+        while heap:
+            distance, vertex = heapq.heappop(heap)
+            if distance > row[vertex]:
+                continue
+            if remaining is not None:
+                remaining.discard(vertex)
+                if not remaining:
+                    return row
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                station = neighbours[edge]
+                newDistance = distance + weights[edge]
+                if newDistance < row[station]:
+                    row[station] = newDistance
+                    heapq.heappush(heap, (newDistance, station))
+                    if parents is not None:
+                        parents[station] = vertex
+        return row
+    
+    # shortest path tree from station id source, as (row, parents) where row
+    # is the stopsFrom or distancesFrom row for kind "stops" or "distance";
+    # answered from the tree cache when it is on, and stored there otherwise
+    def shortestPathTree(self, kind, source):
+        if self.treeCache is not None:
+            tree = self.treeCache.get((kind, source))
+            if tree is not None:
+                return tree
+        parents = array("l", [-1])*self.graph.size()
+        if kind == "stops":
+            tree = (self.stopsFrom(source, parents=parents), parents)
+        else:
+            tree = (self.distancesFrom(source, parents=parents), parents)
+        if self.treeCache is not None:
+            self.treeCache.put((kind, source), tree)
+        return tree
+    
+    # the cached tree of kind rooted at either source or target, or None; the
+    # network is undirected so a tree from target answers the reverse query
+    def cachedTree(self, kind, source, target):
+        if (kind, source) in self.treeCache.entries:
+            return self.treeCache.get((kind, source)), target
+        if (kind, target) in self.treeCache.entries:
+            return self.treeCache.get((kind, target)), source
+        return None, None
+    
+    # pairs groups a list of (fromS, toS) station name pairs by origin, as a
+    # dict from origin id to a list of (position in pairs, target id); pairs
+    # with an unknown station are left out
+    def groupPairs(self, pairs):
+        ids = self.graph.stationIds
+        groups = {}
+        for index, (fromS, toS) in enumerate(pairs):
+            if fromS in ids and toS in ids:
+                groups.setdefault(ids[fromS], []).append((index, ids[toS]))
+        return groups
+    
+    # minStops for every (fromS, toS) pair in pairs, as an array in the same
+    # order; runs one search per distinct origin, stopping once all of that
+    # origin's destinations are reached
+    def batchMinStops(self, pairs):
+        results = array("i", [-1])*len(pairs)
+        for source, queries in self.groupPairs(pairs).items():
+            if self.stopsMatrix is not None:
+                row = self.stopsMatrix[source]
+            else:
+                row = self.stopsFrom(source, [target for index, target in queries])
+            for index, target in queries:
+                results[index] = row[target]
+        return results
+    
+    # minDistance for every (fromS, toS) pair in pairs, as an array in the
+    # same order (miles, -1.0 where there is no path); runs one search per
+    # distinct origin, stopping once all of its destinations are settled
+    def batchMinDistance(self, pairs):
+        results = array("d", [-1.0])*len(pairs)
+        for source, queries in self.groupPairs(pairs).items():
+            if self.distanceMatrix is not None:
+                row = self.distanceMatrix[source]
+            else:
+                row = self.distancesFrom(source, [target for index, target in queries])
+            for index, target in queries:
+                if row[target] != math.inf:
+                    results[index] = row[target]*KM_TO_MILES
+        return results
+    
+    
+    
+    # stops between every station in sources and every station in targets
+    # (lists of names), as one array row per source; one search per source
+    # that stops once all the targets are reached, -1 where there is no path
+    def stopsTable(self, sources, targets):
+        ids = self.graph.stationIds
+        targetIds = [ids.get(name, -1) for name in targets]
+        known = [target for target in targetIds if target != -1]
+        table = []
+        for name in sources:
+            tableRow = array("i", [-1])*len(targets)
+            if name in ids:
+                if self.stopsMatrix is not None:
+                    row = self.stopsMatrix[ids[name]]
+                else:
+                    row = self.stopsFrom(ids[name], known)
+                for j, target in enumerate(targetIds):
+                    if target != -1:
+                        tableRow[j] = row[target]
+            table.append(tableRow)
+        return table
+    
+    # distances in miles between every station in sources and every station
+    # in targets, as one array row per source; one search per source that
+    # stops once all the targets are settled, -1.0 where there is no path
+    def distanceTable(self, sources, targets):
+        ids = self.graph.stationIds
+        targetIds = [ids.get(name, -1) for name in targets]
+        known = [target for target in targetIds if target != -1]
+        table = []
+        for name in sources:
+            tableRow = array("d", [-1.0])*len(targets)
+            if name in ids:
+                if self.distanceMatrix is not None:
+                    row = self.distanceMatrix[ids[name]]
+                else:
+                    row = self.distancesFrom(ids[name], known)
+                for j, target in enumerate(targetIds):
+                    if target != -1 and row[target] != math.inf:
+                        tableRow[j] = row[target]*KM_TO_MILES
+            table.append(tableRow)
+        return table
+    
+    # track distances in km between every pair of the given station ids, as a
+    # list of rows; one dijkstra per station shares a single heap so all of
+    # them run in one pass, and each stops once it has settled the stations
+    # after it in the list (the rest come from symmetry); raises a ValueError
+    # naming the pairs of stations that cannot reach each other
+    def trackDistanceMatrix(self, stationIds):
+        offsets = self.graph.offsets
+        neighbours = self.graph.neighbours
+        weights = self.graph.weights
+        size = len(stationIds)
+        matrix = [[0.0]*size for i in range(size)]
+        position = {}
+        for i, station in enumerate(stationIds):
+            position[station] = i
+        minimum = []
+        settled = []
+        remaining = []
+        heap = []
+        for i, station in enumerate(stationIds):
+            minimum.append(array("d", [math.inf])*self.graph.size())
+            minimum[i][station] = 0
+            settled.append(set())
+            remaining.append(size - 1 - i)
+            if remaining[i] > 0:
+                heap.append((0, i, station))
+        heapq.heapify(heap)
+        while heap:
+            distance, i, vertex = heapq.heappop(heap)
+            if remaining[i] == 0 or vertex in settled[i]:
+                continue
+            settled[i].add(vertex)
+            j = position.get(vertex, -1)
+            if j > i:
+                matrix[i][j] = distance
+                matrix[j][i] = distance
+                remaining[i] -= 1
+                if remaining[i] == 0:
+                    continue
+            row = minimum[i]
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                station = neighbours[edge]
+                newDistance = distance + weights[edge]
+                if newDistance < row[station]:
+                    row[station] = newDistance
+                    heapq.heappush(heap, (newDistance, i, station))
+        # no line can be built over the track between stations that cannot
+        # reach each other
+        unreachable = []
+        for i in range(size):
+            if remaining[i] > 0:
+                for j in range(i + 1, size):
+                    if stationIds[j] not in settled[i]:
+                        unreachable.append(self.graph.stationNames[stationIds[i]] + " - " + self.graph.stationNames[stationIds[j]])
+        if unreachable:
+            raise ValueError("no track between: " + ", ".join(unreachable))
+        return matrix
+    
+    
+    
+    # returns the stations in line order followed by the line length in km;
+    # method "exact" solves the line exactly with held-karp, "anneal" runs
+    # simulated annealing over swap, 2-opt and or-opt moves with the fixed
+    # cooling schedule, "adaptive" does the same with a schedule calibrated
+    # from the stations, "2opt" runs a deterministic 2-opt local search,
+    # "multistart" keeps the best of chains independent annealing runs spread
+    # over a pool of workers processes and "auto" is exact for up to
+    # exactLimit stations and adaptive from a "best" start otherwise;
+    # start picks the line "anneal", "adaptive" and "2opt" begin from:
+    # "random" (the default), "input" order (the default for "2opt"), or one
+    # built by "nn" (nearest neighbour), "greedy" (greedy edge) or "mst"
+    # (minimum spanning tree), or "best" of those three - the fixed schedule
+    # of "anneal" starts too hot to keep much of a built line; "multistart"
+    # chains always start from random lines, any other start is a ValueError;
+    # metric "straight" joins stations by straight line distance, "track"
+    # by their shortest distance over the existing network (a ValueError if
+    # some of them cannot reach each other);
+    # lastLineInfo records which method ran and whether the line is known to
+    # be optimal, plus the statistics of every chain for "multistart"
+    def newRailwayLine(self, inputList, method="auto", chains=8, workers=None, start=None, metric="straight"):
+        outputList = []
+        # ADD YOUR CODE HERE
+        stationNames = list(dict.fromkeys(inputList))
+        ids = [self.graph.stationIds[name] for name in stationNames]
+        if method == "auto":
+            method = "exact" if len(stationNames) <= self.exactLimit else "adaptive"
+            if start is None and method == "adaptive":
+                start = "best"
+        if start is None:
+            start = "input" if method == "2opt" else "random"
+        if method == "multistart" and start != "random":
+            # every chain shuffles its own random start
+            raise ValueError("multistart only supports a random start: " + str(start))
+        if self.queryCache is not None:
+            # the order of the requested stations does not change the answer;
+            # the key holds the method auto resolved to, so changing
+            # exactLimit is seen
+            key = ("line", frozenset(ids), method, start, metric, chains if method == "multistart" else None)
+            cached = self.queryCache.get(key)
+            if cached is not None:
+                self.lastLineInfo = dict(cached[1])
+                return list(cached[0])
+        if metric == "straight":
+            straightLines = self.graph.straightLineMatrix()
+            optimiser = LineOptimiser([[straightLines[a][b] for b in ids] for a in ids])
+        elif metric == "track":
+            optimiser = LineOptimiser(self.trackDistanceMatrix(ids))
+        else:
+            raise ValueError("unknown newRailwayLine metric: " + str(metric))
+        path = list(range(len(stationNames)))
+        initialAcceptance = 0.8
+        if start == "random":
+            random.shuffle(path)
+        elif start in LINE_STARTS or start == "best":
+            # a constructed line is taken to its 2-opt local optimum, and the
+            # adaptive schedule then starts cool enough to refine it rather
+            # than melt it down
+            length = math.inf
+            for construction in (LINE_STARTS if start == "best" else [start]):
+                built, builtLength = getattr(optimiser, LINE_STARTS[construction])()
+                built, builtLength, passes = optimiser.twoOpt(built)
+                if builtLength < length:
+                    path = built
+                    length = builtLength
+            initialAcceptance = 0.05
+        elif start != "input":
+            raise ValueError("unknown newRailwayLine start: " + str(start))
+        if method == "exact":
+            path, length, iterations = optimiser.heldKarp()
+        elif method == "anneal":
+            path, length, iterations = optimiser.anneal(path, moveTypes=LINE_MOVES)
+        elif method == "multistart":
+            results = self.multiStartAnneal(optimiser.distances, chains, workers)
+            best = min(results, key=lambda result: result["length"])
+            path = best["path"]
+            length = best["length"]
+            iterations = sum(result["iterations"] for result in results)
+        elif method == "adaptive":
+            path, length, iterations = optimiser.adaptiveAnneal(path, moveTypes=LINE_MOVES, initialAcceptance=initialAcceptance)
+        elif method == "2opt":
+            path, length, iterations = optimiser.twoOpt(path)
+        else:
+            raise ValueError("unknown newRailwayLine method: " + str(method))
+        self.lastLineInfo = {"method": method, "optimal": method == "exact" or len(path) < 3, "iterations": iterations}
+        if method == "multistart":
+            self.lastLineInfo["chains"] = [{"seed": result["seed"], "length": result["length"], "iterations": result["iterations"], "seconds": result["seconds"]} for result in results]
+        outputList = [stationNames[i] for i in path]
+        outputList.append(length)
+        if self.queryCache is not None:
+            self.queryCache.put(key, (list(outputList), dict(self.lastLineInfo)))
+        return outputList
+    
+    # runs chains annealing chains with different seeds and returns the result
+    # of each one; workers is the process pool size (None for one per core),
+    # with workers=1 the chains run one after another in this process
+    def multiStartAnneal(self, distances, chains, workers):
+        seeds = [random.randrange(2**32) for i in range(chains)]
+        if workers == 1:
+            initAnnealWorker(distances)
+            return [annealChain(seed) for seed in seeds]
+        with ProcessPoolExecutor(max_workers=workers, initializer=initAnnealWorker, initargs=(distances,)) as pool:
+            return list(pool.map(annealChain, seeds))
 
+# the test code; it lives in a function so its names cannot replace module
+# globals such as the min and max builtins
+def main():
+    test = LondonRailwayMapper()
+    testMapper = LondonRailwayMapper()
+    fromList = ["Baker Street", "Epping", "Canonbury", "Vauxhall"]
+    toList = ["North Wembley", "Belsize Park", "Balham", "Leytonstone"]
+    '''
+    for i in range(len(fromList)):
+        print("From", fromList[i], "to", toList[i])
+        minS = test.minStops(fromList[i], toList[i])
+        minD = test.minDistance(fromList[i], toList[i])
+        print("minStops:\t", minS)
+        print("minDistance:\t", minD)
+        print("\n")
+        '''
+    for i in range(len(fromList)):
+        starttime = timeit.default_timer()
+        stops = testMapper.minStops(fromList[i], toList[i])
+        endtime = timeit.default_timer()
+        print("\nExecution time minStops:", round(endtime-starttime,15))
 
-        #plt.plot(numberset, distset, linewidth = 1, color = 'black', linestyle='-', marker='o',markersize =1 ,  markeredgecolor = "red",label = "distance")
-        #plt.plot(numberset, temperatureset, linewidth = 1, color = 'green', linestyle='-', marker='o',markersize =1 ,  markeredgecolor = "blue",label = "temperture")
-        print(mindis)
-        return outputList
+        starttime = timeit.default_timer()
+        dist = testMapper.minDistance(fromList[i], toList[i])
+        endtime = timeit.default_timer()
+        print("Execution time minDistance:", round(endtime-starttime,15))
 
-test = LondonRailwayMapper()
-testMapper = LondonRailwayMapper()
-fromList = ["Baker Street", "Epping", "Canonbury", "Vauxhall"]
-toList = ["North Wembley", "Belsize Park", "Balham", "Leytonstone"]
-'''
-for i in range(len(fromList)):
-    print("From", fromList[i], "to", toList[i])
-    minS = test.minStops(fromList[i], toList[i])
-    minD = test.minDistance(fromList[i], toList[i])
-    print("minStops:\t", minS)
-    print("minDistance:\t", minD)
-    print("\n")
+        print("From", fromList[i], "to", toList[i], "in", stops, "stops and", dist, "miles")  
+    
     '''
-for i in range(len(fromList)):
+    stationsList = ["Queens Park", "Chigwell", "Moorgate", "Swiss Cottage", "Liverpool Street", "Highgate"]
     starttime = timeit.default_timer()
-    stops = testMapper.minStops(fromList[i], toList[i])
+    newLine = testMapper.newRailwayLine(stationsList)
     endtime = timeit.default_timer()
-    print("\nExecution time minStops:", round(endtime-starttime,15))
+
+    print("\n\nStation list", stationsList)
+    print("New station line", newLine)
+    print("Total track length from", newLine[0], "to", newLine[len(newLine)-1], ":", testMapper.minDistance(newLine[0], newLine[len(newLine)-1]), "miles")
+    print("Execution time newLine:", round(endtime-starttime,3))
+    '''
+    #
+    # testing the newRailwayLine() API on a big list of stations  
+    #
+    stationsList = ["Abbey Road", "Barbican", "Bethnal Green", "Cambridge Heath", "Covent Garden", "Dollis Hill", "East Finchley", "Finchley Road and Frognal", "Great Portland Street", "Hackney Wick", "Isleworth", "Kentish Town West", "Leyton", "Marble Arch", "North Wembley", "Old Street", "Pimlico", "Queens Park", "Richmond", "Shepherds Bush", "Tottenham Hale", "Uxbridge", "Vauxhall", "Wapping"]
 
     starttime = timeit.default_timer()
-    dist = testMapper.minDistance(fromList[i], toList[i])
+    newLine = testMapper.newRailwayLine(stationsList)
     endtime = timeit.default_timer()
-    print("Execution time minDistance:", round(endtime-starttime,15))
-
-    print("From", fromList[i], "to", toList[i], "in", stops, "stops and", dist, "miles")  
-    
-'''
-stationsList = ["Queens Park", "Chigwell", "Moorgate", "Swiss Cottage", "Liverpool Street", "Highgate"]
-starttime = timeit.default_timer()
-newLine = testMapper.newRailwayLine(stationsList)
-endtime = timeit.default_timer()
-
-print("\n\nStation list", stationsList)
-print("New station line", newLine)
-print("Total track length from", newLine[0], "to", newLine[len(newLine)-1], ":", testMapper.minDistance(newLine[0], newLine[len(newLine)-1]), "miles")
-print("Execution time newLine:", round(endtime-starttime,3))
-'''
-#
-# testing the newRailwayLine() API on a big list of stations  
-#
-stationsList = ["Abbey Road", "Barbican", "Bethnal Green", "Cambridge Heath", "Covent Garden", "Dollis Hill", "East Finchley", "Finchley Road and Frognal", "Great Portland Street", "Hackney Wick", "Isleworth", "Kentish Town West", "Leyton", "Marble Arch", "North Wembley", "Old Street", "Pimlico", "Queens Park", "Richmond", "Shepherds Bush", "Tottenham Hale", "Uxbridge", "Vauxhall", "Wapping"]
-
-starttime = timeit.default_timer()
-newLine = testMapper.newRailwayLine(stationsList)
-endtime = timeit.default_timer()
-
-print("\n\nStation list", stationsList)
-print("New station line", newLine)
-#print("Total track length from", newLine[0], "to", newLine[len(newLine)-1], ":", testMapper.minDistance(newLine[0], newLine[len(newLine)-1]), "miles")
-print("Execution time newLine:", round(endtime-starttime,3))
-
-
-mindistset = []
-numcountset = []
-mindistnum = 0
-max = 0
-min = 113123123
-
-for i in range(10):
-    current = float(testMapper.newRailwayLine(stationsList)[len(stationsList)])
-    mindistnum += current
-    if current > max:
-        max = current
-    if current < min:
-        min = current
-    mindistset.append(current)
-    numcountset.append(i)
-
-mindistnum = mindistnum/10
-print("max:",max)
-print("min:",min)
-print("average",mindistnum)
-mindistset.sort()
-
-for j in range(10):
-    plt.scatter(j, mindistset[j])
-
-#plt.legend()
-#plt.show()
 
+    print("\n\nStation list", stationsList)
+    print("New station line", newLine)
+    #print("Total track length from", newLine[0], "to", newLine[len(newLine)-1], ":", testMapper.minDistance(newLine[0], newLine[len(newLine)-1]), "miles")
+    print("Execution time newLine:", round(endtime-starttime,3))
+
+
+    mindistset = []
+    numcountset = []
+    mindistnum = 0
+    maxLength = 0
+    minLength = 113123123
+
+    for i in range(10):
+        current = float(testMapper.newRailwayLine(stationsList)[len(stationsList)])
+        mindistnum += current
+        if current > maxLength:
+            maxLength = current
+        if current < minLength:
+            minLength = current
+        mindistset.append(current)
+        numcountset.append(i)
+
+    mindistnum = mindistnum/10
+    print("max:",maxLength)
+    print("min:",minLength)
+    print("average",mindistnum)
+    mindistset.sort()
+
+    for j in range(10):
+        plt.scatter(j, mindistset[j])
+
+    #plt.legend()
+    #plt.show()
+
+
+# the test code only runs when this file is executed directly, so pool
+# workers importing it do not rerun it
+if __name__ == "__main__":
+    main()